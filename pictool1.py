@@ -12,80 +12,64 @@ Date: June 9, 2025
 
 from PIL import Image as CoreImage
 import traceback
-from rgb import RGB
+import functools
+import inspect
+import numpy as np
+import re
 import os.path
 import plugins2
 import sys
 
-PROGRESS = 10
+OPTION = re.compile(r'--([^=]+)=(.*)')
+BOOLEANS = {'True': True, 'False': False}
 
-def read_image(file):
+def open_image(file):
+    """
+    Returns the file as an RGBA Pillow image, or None if it cannot be loaded.
+    """
     try:
         image = CoreImage.open(file)
         print(('Loading ' + repr(file)), end='', flush=True)
         image = image.convert("RGBA")
-        width, height = image.size
-        size = width * height
-        block = max(size // PROGRESS, 1)
-        source = iter(image.getdata())
-        buffer = []
-        for r in range(height):
-            row = []
-            for c in range(width):
-                tups = next(source)
-                row.append(RGB(*tups))
-                if (r * width + c) % block == 0:
-                    print('.', end='', flush=True)
-            buffer.append(row)
         print('done')
-        return buffer
+        return image
     except:
         traceback.print_exc()
         print('Could not load the file ' + repr(file))
         return None
 
+def read_image(file):
+    image = open_image(file)
+    if image is None:
+        return None
+    width, height = image.size
+    buffer = np.frombuffer(image.tobytes(), dtype=np.uint8)
+    return buffer.reshape(height, width, 4).copy()
+
 def verify_image(buffer):
-    if type(buffer) != list or len(buffer) == 0:
-        return False
-    first = buffer[0]
-    if type(first) != list or len(first) == 0:
-        return False
-    width = len(first)
-    for row in buffer:
-        if len(row) != width:
-            return False
-        for item in row:
-            if type(item) != RGB:
-                return False
-    return True
+    return (isinstance(buffer, np.ndarray) and buffer.dtype == np.uint8 and
+            buffer.ndim == 3 and buffer.shape[2] == 4 and buffer.size > 0)
 
-def save_image(buffer, file):
-    assert verify_image(buffer), 'A plug-in has corrupted the image data'
+def write_image(image, file):
+    """
+    Saves a Pillow image to the file as a PNG.
+    """
     try:
-        height = len(buffer)
-        width = len(buffer[0])
-        size = width * height
-        block = max(size // PROGRESS, 1)
         print(('Saving ' + repr(file)), end='', flush=True)
-        im = CoreImage.new('RGBA', (width, height))
-        output = []
-        for r in range(height):
-            for c in range(width):
-                pixel = buffer[r][c]
-                output.append(pixel.rgba())
-                if (r * width + c) % block == 0:
-                    print('.', end='', flush=True)
-        im.putdata(output)
-        im.save(file, 'PNG')
+        image.save(file, 'PNG')
         print('done')
     except:
         traceback.print_exc()
         print('Could not save the file ' + repr(file))
 
+def save_image(buffer, file):
+    assert verify_image(buffer), 'A plug-in has corrupted the image data'
+    write_image(CoreImage.fromarray(buffer, 'RGBA'), file)
+
 def parse_args(args):
     options = extract_options(args)
     result = {}
-    usage = 'usage: python3 pictool.py command [options] input [output]'
+    usage = 'usage: python3 pictool1.py command [options] input [output]'
     if not len(args) in [3, 4]:
         result['error'] = usage
     else:
@@ -100,32 +84,43 @@ def parse_args(args):
             result['output'] = args[3]
     return result
 
-def lookup_command(command, options):
-    if not hasattr(plugins2, command):
-        return 'error: unrecognized command ' + repr(command)
-    error = None
-    function = getattr(plugins2, command)
+def plugin_options(function):
+    """
+    Returns the option names accepted by a plug-in, or None if any parameter
+    after the first one has no default value.
+    """
     param = function.__code__.co_varnames[:function.__code__.co_argcount]
     dsize = 0 if function.__defaults__ is None else len(function.__defaults__)
     if len(param) != dsize + 1:
-        error = 'error: plugin ' + repr(command) + ' does not have default values after first parameter'
-    else:
-        badargs = [key for key in options if key not in param]
-        if badargs:
-            flags = ', '.join('--' + x for x in badargs)
-            error = 'error: plugin ' + repr(command) + ' does not recognize the following options: ' + flags
-    return function if error is None else error
+        return None
+    return frozenset(param[1:])
+
+COMMANDS = {name: function for name, function in vars(plugins2).items()
+            if inspect.isfunction(function) and function.__module__ == plugins2.__name__
+            and not name.startswith('_')}
+PARAMS = {name: plugin_options(function) for name, function in COMMANDS.items()}
+
+def lookup_command(command, options):
+    if command not in COMMANDS:
+        return 'error: unrecognized command ' + repr(command)
+    param = PARAMS[command]
+    if param is None:
+        return 'error: plugin ' + repr(command) + ' does not have default values after first parameter'
+    badargs = [key for key in options if key not in param]
+    if badargs:
+        flags = ', '.join('--' + x for x in badargs)
+        return 'error: plugin ' + repr(command) + ' does not recognize the following options: ' + flags
+    return COMMANDS[command]
 
 def extract_options(args):
     options = {}
     pos = 1
     while pos < len(args):
-        item = args[pos]
-        if item.startswith('--') and '=' in item:
-            split = item.find('=')
-            value = item[split + 1:]
-            if value in ['True', 'False']:
-                value = eval(value)
+        match = OPTION.match(args[pos])
+        if match:
+            name, value = match.groups()
+            if value in BOOLEANS:
+                value = BOOLEANS[value]
             elif value.isdigit():
                 value = int(value)
             else:
@@ -133,29 +128,71 @@ def extract_options(args):
                     value = float(value)
                 except:
                     pass
-            options[item[2:split]] = value
+            options[name] = value
             del args[pos]
         else:
             pos += 1
     return options
 
+def option_value(command, options, name):
+    """
+    Returns the value of a plug-in option, falling back to the default in the
+    plug-in's signature when it was not given on the command line.
+    """
+    if name in options:
+        return options[name]
+    return inspect.signature(command).parameters[name].default
+
+def native_transpose(command, options):
+    """
+    Returns the Pillow transpose method that matches a geometric plug-in called
+    with these options, or None if the command has no Pillow equivalent.
+    """
+    if command is plugins2.flip:
+        if option_value(command, options, 'vertical'):
+            return CoreImage.Transpose.FLIP_TOP_BOTTOM
+        return CoreImage.Transpose.FLIP_LEFT_RIGHT
+    if command is plugins2.transpose:
+        return CoreImage.Transpose.TRANSPOSE
+    if command is plugins2.rotate:
+        if option_value(command, options, 'right'):
+            return CoreImage.Transpose.ROTATE_270
+        return CoreImage.Transpose.ROTATE_90
+    return None
+
+def transpose_image(image, method):
+    """
+    Returns the Pillow image transposed by the given method.
+    """
+    return image.transpose(method)
+
 def main():
     import datetime
     args = parse_args(sys.argv[:])
     if 'error' in args:
         print(args['error'])
         return
-    buffer = read_image(args['input'])
+    # Geometric plug-ins run on the Pillow image, skipping the pixel buffer
+    method = native_transpose(args['command'], args['options'])
+    if method is None:
+        load, save = read_image, save_image
+        command = functools.partial(args['command'], **args['options'])
+    else:
+        load, save = open_image, write_image
+        command = functools.partial(transpose_image, method=method)
+    buffer = load(args['input'])
     if buffer is None:
         return
     start = datetime.datetime.now()
     print('Processing ' + repr(args['input']), end='', flush=True)
-    process = args['command'](buffer, **args['options'])
+    process = command(buffer)
+    if isinstance(process, (np.ndarray, CoreImage.Image)):
+        buffer, process = process, True
     print('..done')
     end = datetime.datetime.now()
     print('Time: ' + str(end - start))
     if process and 'output' in args:
-        save_image(buffer, args['output'])
+        save(buffer, args['output'])
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
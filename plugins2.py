@@ -2,31 +2,66 @@
 Plugin utilities for the pictool.
 
 Each function here is a valid plug-in. To be valid, a function must:
-- Accept an image buffer (2D list of RGB objects) as the first argument
+- Accept an image buffer (a height x width x 4 NumPy array of uint8 RGBA
+  values) as the first argument
 - Have default values for all other parameters
-- Return True if it modifies the image and False if it doesn't
+- Return True if it modifies the image and False if it doesn't. A plug-in may
+  instead return a new buffer (such as a view with a different shape), which
+  replaces the original image.
 
 Author: Ian Ifill
 Date: June 9, 2025
 """
 
-from rgb import RGB
-import math
-import random
+from concurrent.futures import ThreadPoolExecutor
+from rgb import pixels
+import numpy as np
+import functools
+import os
+
+# Loading Numba and a cached kernel costs a few hundred milliseconds per run,
+# so the compiled kernels are only used on images at least this large. Blur
+# also needs a radius small enough for the direct window sums to win.
+JIT_BLUR_RADIUS = 2
+JIT_BLUR_PIXELS = 10_000_000
+JIT_VIGNETTE_PIXELS = 16_000_000
+
+# Number of horizontal bands processed in parallel by the banded plug-ins
+THREADS = os.cpu_count() or 1
+
+def _in_bands(function, image, *args):
+    """
+    Calls function(band, first_row, *args) on horizontal bands of the image.
+
+    Each band runs on its own thread. NumPy releases the GIL inside its loops,
+    so the bands are processed in parallel.
+    """
+    bounds = np.linspace(0, len(image), min(THREADS, len(image)) + 1).astype(int)
+    if len(bounds) <= 2:
+        function(image, 0, *args)
+        return
+    with ThreadPoolExecutor(len(bounds) - 1) as pool:
+        jobs = [pool.submit(function, image[lo:hi], lo, *args)
+                for lo, hi in zip(bounds[:-1], bounds[1:])]
+        for job in jobs:
+            job.result()
+
+def _pixel_repr(pixel):
+    return 'RGB(%d, %d, %d, %d)' % (pixel['red'], pixel['green'], pixel['blue'], pixel['alpha'])
 
 def display(image):
     """
     Returns False after printing all pixels in a readable format.
     Does not modify the image.
     """
-    height = len(image)
-    width  = len(image[0])
-    maxsize = max(len(repr(pixel)) for row in image for pixel in row)
+    records = pixels(image)
+    height, width = records.shape
+    maxsize = max(len(_pixel_repr(pixel)) for row in records for pixel in row)
 
     print()
-    for r, row in enumerate(image):
+    for r, row in enumerate(records):
         for c, pixel in enumerate(row):
-            middle = repr(pixel)
+            middle = _pixel_repr(pixel)
             padding = maxsize - len(middle)
 
             prefix = '      '
@@ -48,179 +83,225 @@ def dered(image):
     """
     Returns True after removing all red from the image.
     """
-    for row in image:
-        for pixel in row:
-            pixel.red = 0
+    pixels(image)['red'] = 0
     return True
 
+# Brightness weights 0.3/0.6/0.1 in 8-bit fixed point (they sum to 256)
+RED_WEIGHT, GREEN_WEIGHT, BLUE_WEIGHT = 77, 154, 25
+
+# Sepia scales brightness by 1.0/0.6/0.4 in 8-bit fixed point
+SEPIA_TINT = np.array([256, 154, 102], dtype=np.uint16)
+
 def mono(image, sepia=False):
     """
     Converts the image to grayscale or sepia.
+
+    Brightness and the sepia tint use the 8-bit fixed-point constants
+    RED_WEIGHT, GREEN_WEIGHT, BLUE_WEIGHT and SEPIA_TINT, so the whole image
+    is done in uint16 arithmetic.
     """
-    for row in image:
-        for pixel in row:
-            brightness = 0.3 * pixel.red + 0.6 * pixel.green + 0.1 * pixel.blue
-            if sepia:
-                pixel.red = int(brightness)
-                pixel.green = int(0.6 * brightness)
-                pixel.blue = int(0.4 * brightness)
-            else:
-                gray = int(brightness)
-                pixel.red = gray
-                pixel.green = gray
-                pixel.blue = gray
+    rgb = image[..., :3].astype(np.uint16)
+    brightness = (rgb[..., 0] * RED_WEIGHT + rgb[..., 1] * GREEN_WEIGHT +
+                  rgb[..., 2] * BLUE_WEIGHT) >> 8
+    if sepia:
+        image[..., :3] = (brightness[..., None] * SEPIA_TINT) >> 8
+    else:
+        image[..., :3] = brightness[..., None]
     return True
 
 def flip(image, vertical=False):
     """
     Flips the image horizontally (default) or vertically.
+
+    Returns the flipped image as a view of the original buffer.
     """
     if vertical:
-        image.reverse()
-    else:
-        for row in image:
-            row.reverse()
-    return True
+        return image[::-1]
+    return image[:, ::-1]
 
 def transpose(image):
     """
     Transposes the image (swap rows and columns).
+
+    Returns the transposed image as a view of the original buffer.
     """
-    if not image or not image[0]:
-        return True
-    rows = len(image)
-    cols = len(image[0])
-    transposed = [[image[r][c] for r in range(rows)] for c in range(cols)]
-    image.clear()
-    image.extend(transposed)
-    return True
+    return image.swapaxes(0, 1)
 
 def rotate(image, right=False):
     """
     Rotates the image 90 degrees left or right.
+
+    Returns the rotated image as a new contiguous buffer, copied in a single
+    pass from the rotated view.
     """
-    if right:
-        flip(image, vertical=True)
-        transpose(image)
-    else:
-        transpose(image)
-        flip(image, vertical=True)
-    return True
+    return np.ascontiguousarray(np.rot90(image, k=-1 if right else 1))
+
+def _vignette_band(band, first_row, center_row, center_col, inverse):
+    rows = np.arange(first_row, first_row + len(band))[:, None] - center_row
+    cols = np.arange(band.shape[1])[None, :] - center_col
+    factor = (1 - (rows * rows + cols * cols) * inverse).astype(np.float32)
+    shaded = band[..., :3].astype(np.float32) * factor[..., None]
+    band[..., :3] = np.clip(np.rint(shaded), 0, 255)
+
+@functools.lru_cache(maxsize=None)
+def _vignette_kernel():
+    """
+    Returns the compiled vignette kernel, or None if Numba is not installed.
+    """
+    try:
+        from numba import njit, prange
+    except ImportError:
+        return None
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def kernel(image, center_row, center_col, inverse):
+        height, width = image.shape[:2]
+        for r in prange(height):
+            for c in range(width):
+                factor = 1.0 - ((r - center_row)**2 + (c - center_col)**2) * inverse
+                for k in range(3):
+                    image[r, c, k] = np.rint(image[r, c, k] * factor)
+    return kernel
 
 def vignette(image):
     """
     Darkens the corners of the image using a vignette effect.
+
+    The darkening factor depends only on the distance from the center, so it
+    is built for each band of rows at once and applied in a single multiply.
+    For images of at least JIT_VIGNETTE_PIXELS pixels with Numba available, a
+    compiled kernel does this in one pass instead.
     """
-    height = len(image)
-    width = len(image[0])
+    height, width = image.shape[:2]
     center_row = height // 2
     center_col = width // 2
-    H = math.sqrt(center_row**2 + center_col**2)
-
-    for r in range(height):
-        for c in range(width):
-            d = math.sqrt((r - center_row)**2 + (c - center_col)**2)
-            factor = 1 - (d / H)**2
-            pixel = image[r][c]
-            pixel.red   = round(pixel.red * factor)
-            pixel.green = round(pixel.green * factor)
-            pixel.blue  = round(pixel.blue * factor)
+    # Distances are compared squared, so no square root is ever taken. A
+    # single pixel is its own center and is left as it is.
+    H2 = center_row**2 + center_col**2
+    inverse = 1.0 / H2 if H2 else 0.0
+    kernel = _vignette_kernel() if height * width >= JIT_VIGNETTE_PIXELS else None
+    if kernel is not None:
+        kernel(image, center_row, center_col, inverse)
+        return True
+    _in_bands(_vignette_band, image, center_row, center_col, inverse)
     return True
 
-def blur(image, radius=5):
+def _box_sums(values, radius, axis):
     """
-    Applies a box blur to the image using a copy of original pixels.
+    Returns the sums over a window of +/- radius along axis, clipped at the
+    edges, together with the number of entries in each window.
     """
-    height = len(image)
-    width = len(image[0])
-    original = [[RGB(p.red, p.green, p.blue, p.alpha) for p in row] for row in image]
+    size = values.shape[axis]
+    shape = list(values.shape)
+    shape[axis] = 1
+    totals = np.concatenate((np.zeros(shape, values.dtype), np.cumsum(values, axis=axis)), axis=axis)
+    index = np.arange(size)
+    upper = np.minimum(index + radius + 1, size)
+    lower = np.maximum(index - radius, 0)
+    sums = np.take(totals, upper, axis=axis) - np.take(totals, lower, axis=axis)
+    return sums, upper - lower
 
-    for r in range(height):
-        for c in range(width):
+@functools.lru_cache(maxsize=None)
+def _blur_kernel():
+    """
+    Returns the compiled blur kernel, or None if Numba is not installed.
+    """
+    try:
+        from numba import njit, prange
+    except ImportError:
+        return None
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def kernel(src, dst, radius):
+        height, width, depth = src.shape
+        for r in prange(height):
             row_min = max(0, r - radius)
             row_max = min(height - 1, r + radius)
-            col_min = max(0, c - radius)
-            col_max = min(width - 1, c + radius)
-
-            total_red = total_green = total_blue = total_alpha = count = 0
-
-            for i in range(row_min, row_max + 1):
-                for j in range(col_min, col_max + 1):
-                    p = original[i][j]
-                    total_red += p.red
-                    total_green += p.green
-                    total_blue += p.blue
-                    total_alpha += p.alpha
-                    count += 1
-
-            image[r][c] = RGB(
-                round(total_red / count),
-                round(total_green / count),
-                round(total_blue / count),
-                round(total_alpha / count)
-            )
+            for c in range(width):
+                col_min = max(0, c - radius)
+                col_max = min(width - 1, c + radius)
+                count = (row_max - row_min + 1) * (col_max - col_min + 1)
+                for k in range(depth):
+                    total = 0
+                    for i in range(row_min, row_max + 1):
+                        for j in range(col_min, col_max + 1):
+                            total += src[i, j, k]
+                    dst[r, c, k] = np.rint(total / count)
+    return kernel
+
+def _blur_band(band, first_row, source, radius):
+    # Rows within radius of the band are read from the unmodified source
+    lo = max(0, first_row - radius)
+    hi = min(len(source), first_row + len(band) + radius)
+    sums, rows = _box_sums(source[lo:hi].astype(np.int64), radius, 0)
+    start = first_row - lo
+    sums = sums[start:start + len(band)]
+    rows = rows[start:start + len(band)]
+    sums, cols = _box_sums(sums, radius, 1)
+    band[:] = np.rint(sums / (rows[:, None] * cols[None, :])[..., None])
+
+def blur(image, radius=5):
+    """
+    Applies a box blur to the image.
+
+    The box filter is separable, so the window sums are taken from running
+    totals along the rows and then the columns. The cost does not depend on
+    the radius. Bands of rows are blurred on separate threads. Small radii
+    on large images use a compiled kernel instead when Numba is available.
+    """
+    height, width = image.shape[:2]
+    kernel = None
+    if radius <= JIT_BLUR_RADIUS and height * width >= JIT_BLUR_PIXELS:
+        kernel = _blur_kernel()
+    if kernel is not None:
+        kernel(image.copy(), image, radius)
+        return True
+    _in_bands(_blur_band, image, image.copy(), radius)
     return True
 
 def pixellate(image, step=10):
     """
     Applies a pixelation effect to the image using step x step blocks.
+
+    Block totals are reduced for the whole image at once; blocks cut off at
+    the right or bottom edge average only the pixels they contain.
     """
-    height = len(image)
-    width = len(image[0])
-
-    for row in range(0, height, step):
-        for col in range(0, width, step):
-            row_max = min(row + step, height)
-            col_max = min(col + step, width)
-            total_red = total_green = total_blue = total_alpha = count = 0
-
-            for r in range(row, row_max):
-                for c in range(col, col_max):
-                    p = image[r][c]
-                    total_red += p.red
-                    total_green += p.green
-                    total_blue += p.blue
-                    total_alpha += p.alpha
-                    count += 1
-
-            avg_pixel = RGB(
-                round(total_red / count),
-                round(total_green / count),
-                round(total_blue / count),
-                round(total_alpha / count)
-            )
-
-            for r in range(row, row_max):
-                for c in range(col, col_max):
-                    image[r][c] = avg_pixel
+    height, width = image.shape[:2]
+    row_starts = np.arange(0, height, step)
+    col_starts = np.arange(0, width, step)
+    rows = np.diff(np.append(row_starts, height))
+    cols = np.diff(np.append(col_starts, width))
+
+    totals = np.add.reduceat(image.astype(np.int64), row_starts, axis=0)
+    totals = np.add.reduceat(totals, col_starts, axis=1)
+    means = np.rint(totals / (rows[:, None] * cols[None, :])[..., None])
+    image[:] = np.repeat(np.repeat(means, rows, axis=0), cols, axis=1)
     return True
 
 def scramble(image, amount=500):
     """
     Randomly changes a number of pixels in the image.
     """
-    height = len(image)
-    width = len(image[0])
-
-    for _ in range(amount):
-        r = random.randint(0, height - 1)
-        c = random.randint(0, width - 1)
-        pixel = image[r][c]
-        image[r][c] = RGB(
-            random.randint(0, 255),
-            random.randint(0, 255),
-            random.randint(0, 255),
-            pixel.alpha
-        )
+    height, width = image.shape[:2]
+    rng = np.random.default_rng()
+    rows = rng.integers(0, height, amount)
+    cols = rng.integers(0, width, amount)
+    image[rows, cols, :3] = rng.integers(0, 256, (amount, 3), dtype=np.uint8)
     return True
 
+def _brighten_band(band, first_row, scale):
+    shaded = (band[..., :3].astype(np.uint32) * scale + 128) >> 8
+    np.minimum(shaded, 255, out=shaded)
+    band[..., :3] = shaded
+
 def brighten(image, factor=1.25):
     """
     Brightens the image by multiplying RGB values by a factor (max 255).
+
+    The factor is applied in 8-bit fixed point, rounding to the nearest value.
     """
-    for row in image:
-        for pixel in row:
-            pixel.red   = min(round(pixel.red * factor), 255)
-            pixel.green = min(round(pixel.green * factor), 255)
-            pixel.blue  = min(round(pixel.blue * factor), 255)
-    return True
\ No newline at end of file
+    # Any scale from 255 * 256 up already saturates every nonzero channel, so
+    # clamping to that range keeps the uint32 product from overflowing
+    scale = min(max(int(round(factor * 256)), 0), 255 * 256)
+    _in_bands(_brighten_band, image, scale)
+    return True
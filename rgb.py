@@ -1,20 +1,24 @@
-rgb_py_content =""
-class RGB:
-    def __init__(self, red, green, blue, alpha=255):
-        self.red = int(red)
-        self.green = int(green)
-        self.blue = int(blue)
-        self.alpha = int(alpha)
+"""
+Pixel layout for image buffers.
 
-    def rgba(self):
-        return (self.red, self.green, self.blue, self.alpha)
+Images are stored as height x width x 4 arrays of uint8 RGBA values. PIXEL_DTYPE
+names those four bytes, so a buffer can also be viewed as a 2D array of pixel
+records without copying it.
 
-    def __repr__(self):
-        return f"RGB({self.red}, {self.green}, {self.blue}, {self.alpha})"
+Author: Ian Ifill
+Date: June 9, 2025
+"""
 
+import numpy as np
 
-# Save this to a file so the user can download it
-with open("/mnt/data/rgb.py", "w") as f:
-    f.write(rgb_py_content)
+PIXEL_DTYPE = np.dtype([('red', 'u1'), ('green', 'u1'), ('blue', 'u1'), ('alpha', 'u1')])
 
-"/mnt/data/rgb.py"
\ No newline at end of file
+def pixels(buffer):
+    """
+    Returns a height x width array of pixel records sharing memory with buffer.
+
+    Fields are read and written by name, as in pixels(buffer)['red'] or
+    pixels(buffer)[r, c]['alpha']. The buffer must be contiguous along its
+    last axis (every buffer from read_image is).
+    """
+    return buffer.view(PIXEL_DTYPE)[..., 0]